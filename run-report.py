@@ -13,14 +13,23 @@ import os
 import sys
 import csv
 import json
-import matplotlib.pyplot as plt
+import time
+import threading
 from fpdf import FPDF
 from genericpath import exists
 from zipfile import ZIP_DEFLATED, ZipFile
 from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from oci.core.models import volume_attachment
 
+# -----------------------------------------------------------------------------
+# Modo servico (--service): mantem os clients carregados, refaz a coleta
+# periodicamente e publica o ultimo relatorio via HTTP.
+service_mode = '--service' in sys.argv
+if service_mode:
+    sys.argv.remove('--service')
+
 if len(sys.argv) >= 2:
     if not re.match('^principal$', str(sys.argv[1]).lower()):
         config_file = sys.argv[1]
@@ -28,12 +37,20 @@ if len(sys.argv) >= 2:
             print('[ERRO] OCI config file not exist (%s).' % (config_file))
             sys.exit()
         oci_config = oci.config.from_file(config_file, 'DEFAULT')
+
+        # Signer unico reutilizado por todos os clients (a chave privada e
+        # carregada apenas uma vez):
+        auth = config_file
+        signer = oci.signer.Signer.from_config(oci_config)
+        home_region = oci_config['region']
     else:
         oci_config = {}
 
         # By default this will hit the auth service in the region returned by
         # http://169.254.169.254/opc/v2/instance/region on the instance.
+        auth = 'instance_principal'
         signer = oci.auth.signers.InstancePrincipalsSecurityTokenSigner()
+        home_region = signer.region
 
     if len(sys.argv) >= 3:
         compartment_ocid = sys.argv[2]
@@ -97,51 +114,333 @@ def get_instance(compute_client, compartment_id):
     ).data
 
 # -----------------------------------------------------------------------------
-def plotGraph(path, file, metrics):
+def readGraphs():
     """
-    Cria um grafico com os dados recebidos.
+    Le a lista de graficos do arquivo .graphs. Cada item retornado
+    contem a lista de (metrica, cor) e a legenda do eixo Y.
     """
-    fontLegend = {'family': 'serif', 'color': 'black', 'size': 14}
+    graphList = list()
     with open('.graphs', 'r', encoding='utf-8') as graphsFile:
         for line in graphsFile.readlines():
-            if not re.match('^#', line):
+            if not re.match('^#', line) and line.strip():
                 (graphs, legend_y) = line.split('~')
-                plot_grapth = False
-                for graph in (graphs.split(',')):
-                    (metric_name, color) = graph.split(':')
-                    if metric_name in metrics:
-                        plot_grapth = True
-                        plt.rcParams['figure.figsize'] = [9, 2.5]
-                        plt.plot(
-                            metrics[metric_name]['values']['x'],
-                            metrics[metric_name]['values']['y'],
-                            color=color,
-                            linestyle='solid',
-                            linewidth=1,
-                            label=('%s | mim:%.2f, avg:%.2f, max:%.2f' % (
-                                metric_name,
-                                metrics[metric_name]['min'],
-                                metrics[metric_name]['avg'],
-                                metrics[metric_name]['max'])
-                            )
-                        )
+                graphList.append((
+                    [tuple(graph.split(':')) for graph in graphs.split(',')],
+                    legend_y.strip()
+                ))
+    return graphList
+
+# -----------------------------------------------------------------------------
+def downsample(values, max_points):
+    """
+    Reduz a quantidade de pontos de uma serie para no maximo max_points,
+    preservando o minimo e o maximo de cada intervalo (picos).
+    """
+    size = len(values['y'])
+    if not max_points or size <= max_points:
+        return values
+    buckets = max(1, max_points // 2)
+    sampled = {"x": list(), "y": list()}
+    for bucket in range(buckets):
+        start = (bucket * size) // buckets
+        end = ((bucket + 1) * size) // buckets
+        if start >= end:
+            continue
+        low = min(range(start, end), key=lambda i: values['y'][i])
+        high = max(range(start, end), key=lambda i: values['y'][i])
+        for i in sorted(set([low, high])):
+            sampled['x'].append(values['x'][i])
+            sampled['y'].append(values['y'][i])
+    return sampled
 
-                if plot_grapth:
-                    plt.legend(bbox_to_anchor=(
-                        0, 1.02, 1, 0.2), loc="lower left", mode="expand", borderaxespad=0, ncol=3)
-
-                    plt.ylabel(legend_y, fontdict=fontLegend)
-                    plt.xlabel("Timeaxis (day)", fontdict=fontLegend)
-                    # plt.ylim(0, 100)
-                    plt.savefig(
-                        fname=(('%s/%s_%s.png') % (path, file, metric_name)),
-                        dpi=100,
-                        bbox_inches='tight',
-                        pad_inches=0.1,
-                        transparent=False
+# -----------------------------------------------------------------------------
+def get_region_name(region):
+    """
+    Converte o codigo curto da regiao (ex.: iad, usado nos ocids) para o
+    nome completo (ex.: us-ashburn-1).
+    """
+    region = region.lower()
+    return oci.regions.REGIONS_SHORT_NAMES.get(region, region)
+
+# -----------------------------------------------------------------------------
+def get_client(service, region_name=None):
+    """
+    Retorna o client do servico OCI para a regiao informada (ou a home
+    region, se nenhuma for informada). Cada client e
+    criado apenas uma vez por (servico, regiao, autenticacao), reutilizando
+    o mesmo signer e mantendo as conexoes (TLS) abertas entre chamadas.
+    """
+    region_name = get_region_name(region_name or home_region)
+    key = (service.__name__, region_name, auth)
+
+    if not key in client_registry:
+        config = dict(oci_config, region=region_name)
+        client_registry[key] = service(config=config, signer=signer, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
+        client_stats['created'] += 1
+    else:
+        client_stats['reused'] += 1
+    return client_registry[key]
+
+# -----------------------------------------------------------------------------
+def get_client_stats():
+    """
+    Estatisticas de reutilizacao dos clients e das conexoes HTTP: clients
+    criados/reutilizados e o total de requisicoes feitas sobre as conexoes
+    abertas por cada client. Os contadores de conexoes dependem de
+    detalhes internos do SDK e ficam como None quando nao disponiveis.
+    """
+    stats = {'created': client_stats['created'], 'reused': client_stats['reused'], 'clients': dict()}
+    for (key, client) in client_registry.items():
+        requests = connections = 0
+        try:
+            adapter = client.base_client.session.get_adapter('https://')
+            for pool_key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(pool_key)
+                if pool:
+                    requests += pool.num_requests
+                    connections += pool.num_connections
+        except AttributeError:
+            requests = connections = None
+        stats['clients']['%s[%s]' % (key[0], key[1])] = {'requests': requests, 'connections': connections}
+    return stats
+
+# -----------------------------------------------------------------------------
+def get_clients(region_name):
+    """
+    Retorna os clients (compute, monitoring, block storage e identity) da
+    regiao informada a partir do registro de clients.
+    """
+    return (
+        get_client(oci.core.ComputeClient, region_name),
+        get_client(oci.monitoring.MonitoringClient, region_name),
+        get_client(oci.core.BlockstorageClient, region_name),
+        get_client(oci.identity.IdentityClient, region_name)
+    )
+
+# -----------------------------------------------------------------------------
+def cached_lookup(kind, ocid, lookup):
+    """
+    Consulta um recurso pelo ocid apenas uma vez por coleta, mantendo o
+    resultado em lookup_cache para as proximas instances. O cache e limpo
+    no inicio de cada coleta (run_report).
+    """
+    if not ocid in lookup_cache[kind]:
+        lookup_cache[kind][ocid] = lookup(ocid)
+    return lookup_cache[kind][ocid]
+
+# -----------------------------------------------------------------------------
+def get_instance_details(instance, volumeAttachmentList, compute_client, blockStorage_client):
+    """
+    Consulta o tipo da instance (burstable, preemptible, reservation e
+    dedicated host) e as informacoes dos seus boot/block volumes.
+    Retorna None se a instance nao tiver boot volume anexado. O ultimo item
+    retornado indica se todas as consultas foram concluidas com sucesso.
+    """
+    # -------------------------------------------------------------------------
+    # Validacao do tipo da instance:
+    instanceJson = json.loads(str(instance))
+    instanceType = {
+        'burstable': 'none',
+        'preemptible': 'none',
+        'dedicated_vm_host': 'none',
+        'capacity_reservation': 'none'
+    }
+    if instanceJson['shape_config']['baseline_ocpu_utilization']:
+        instanceType['burstable'] = burstable[instanceJson['shape_config']
+                                              ['baseline_ocpu_utilization']]
+    if instanceJson['preemptible_instance_config']:
+        instanceType['preemptible'] = 'yes'
+    if instanceJson['capacity_reservation_id']:
+        capacityReservationResponse = cached_lookup(
+            'capacity_reservation',
+            instanceJson['capacity_reservation_id'],
+            lambda ocid: compute_client.get_compute_capacity_reservation(capacity_reservation_id=ocid).data
+        )
+        instanceType['capacity_reservation'] = (capacityReservationResponse.display_name).strip()
+    if instanceJson['dedicated_vm_host_id']:
+        dedicatedVmHostResponse = cached_lookup(
+            'dedicated_vm_host',
+            instanceJson['dedicated_vm_host_id'],
+            lambda ocid: compute_client.get_dedicated_vm_host(dedicated_vm_host_id=ocid).data
+        )
+        instanceType['dedicated_vm_host'] = (dedicatedVmHostResponse.display_name).strip()
+
+    # -------------------------------------------------------------------------
+    # Lista de informacoes para coleta dos volumes da instance
+    # (boot e block)
+    volumes = {
+        'boot': {'size': 'null', 'vpu': 'null', 'image': '', 'os': {'name': '', 'version': ''}},
+        'block': list()
+    }
+    complete = True
+    # ---------------------------------------------------------------------
+    # Procura por Boot Volume:
+    if instance.id in volumeAttachmentList['boot']:
+        bootVolumeResponse = blockStorage_client.get_boot_volume(
+            boot_volume_id=volumeAttachmentList['boot'][instance.id]['id']
+        ).data
+
+        volumes['boot']['image'] = (bootVolumeResponse.display_name).strip()
+        volumes['boot']['size'] = bootVolumeResponse.size_in_gbs
+        volumes['boot']['vpu'] = bootVolumeResponse.vpus_per_gb
+
+        # ----------------------------------------------------------------
+        # Verifica se o boot volume utilizado nao foi criado em
+        # outra regiao e transferido para essa. nesses cassos
+        # o boot volume preserva o ocid da imagem de origem,
+        # sendo assim, necessario alterar a regiao
+        # no client para consultar essa image.
+        # Falhas na consulta da image (ex.: image removida ou boot volume
+        # sem image_id) nao interrompem a coleta:
+        try:
+            region_object = re.search('^ocid1\.image.oc1.(.*)\.', bootVolumeResponse.image_id, re.IGNORECASE).group(1)
+            if len(region_object) > 0 and get_region_name(region_object) != get_region_name(oci_config['region']):
+                imageResponse = cached_lookup(
+                    'image',
+                    bootVolumeResponse.image_id,
+                    lambda ocid: get_client(oci.core.ComputeClient, region_object).get_image(image_id=ocid).data
+                )
+            else:
+                imageResponse = cached_lookup(
+                    'image',
+                    bootVolumeResponse.image_id,
+                    lambda ocid: compute_client.get_image(image_id=ocid).data
+                )
+        except Exception as exc:
+            print(exc)
+            print('boot volume: %s\nocid:\n%s' % ((bootVolumeResponse.display_name).strip(), bootVolumeResponse.image_id))
+            print(color['red'], 'O que aconteceu... (⊙.☉)7')
+            volumes['boot']['image'] = 'no_data'
+            volumes['boot']['os']['name'] = 'no_data'
+            volumes['boot']['os']['version'] = 'no_data'
+            imageResponse = None
+            complete = False
+
+        if imageResponse:
+            volumes['boot']['image'] = (imageResponse.display_name).strip()
+            volumes['boot']['os']['name'] = imageResponse.operating_system
+            volumes['boot']['os']['version'] = imageResponse.operating_system_version
+        del(imageResponse, bootVolumeResponse)
+
+    else:
+        # Instance sem boot volume anexado (ex.: provisionando ou
+        # terminando) e ignorada nesta coleta:
+        print('    - [%sWARN%s] %s: onde esta o boot volume dessa maquina !!!! (%s)' % (color['yellow'], color['clean'], (instance.display_name).strip(), instance.id))
+        return None
+
+    # ---------------------------------------------------------------------
+    # Procura por Block Volume:
+    if instance.id in volumeAttachmentList['block']:
+        for Attachment in volumeAttachmentList['block'][instance.id]:
+            # ---------------------------------------------------------
+            # Podem existir boot volumes anexados como block 
+            # volumes.Nesse caso precisamos verificar o ocid 
+            # para utilizar a chamada correta da API e pegar
+            # as informacoes do volume.
+            try:
+                if re.match('^(ocid1\.bootvolume).*', str(Attachment.volume_id)):
+                    # ocid1.bootvolume....
+                    volumeResponse = blockStorage_client.get_boot_volume(
+                        boot_volume_id=Attachment.volume_id
+                    ).data
+                elif re.match('^(ocid1\.volume).*', str(Attachment.volume_id)):
+                    # ocid1.volume.oc1....
+                    volumeResponse = blockStorage_client.get_volume(
+                        volume_id=Attachment.volume_id
+                    ).data
+                volumes['block'].append({
+                    'name': (volumeResponse.display_name).strip(),
+                    'size': volumeResponse.size_in_gbs,
+                    'vpu': volumeResponse.vpus_per_gb
+                })
+                del(volumeResponse)
+            except Exception as exc:
+                print(exc)
+                print('instance: %s\nblock_volume_info:\n%s' % ((instance.display_name).strip(), Attachment))
+                print(color['red'], 'O que aconteceu... (⊙.☉)7')
+                complete = False
+
+    return (instanceType, volumes, complete)
+
+# -----------------------------------------------------------------------------
+def get_instance_signature(instance, volumeAttachmentList):
+    """
+    Campos que indicam mudanca na instance entre duas coletas: estado,
+    shape, shape config, reservation, dedicated host e volumes anexados.
+    """
+    instanceJson = json.loads(str(instance))
+    signature = {
+        'lifecycle_state': instance.lifecycle_state,
+        'shape': instance.shape,
+        'shape_config': instanceJson['shape_config'],
+        'capacity_reservation_id': instanceJson['capacity_reservation_id'],
+        'dedicated_vm_host_id': instanceJson['dedicated_vm_host_id'],
+        'boot': volumeAttachmentList['boot'].get(instance.id),
+        'block': sorted([
+            '%s~%s~%s' % (attachment.id, attachment.volume_id, attachment.lifecycle_state)
+            for attachment in volumeAttachmentList['block'].get(instance.id, list())
+        ])
+    }
+    # Normaliza para o mesmo formato gravado no arquivo de inventario:
+    return json.loads(json.dumps(signature, default=str))
+
+# -----------------------------------------------------------------------------
+def load_inventory(inventory_file):
+    """
+    Carrega o inventario gravado na ultima coleta.
+    """
+    if exists(inventory_file):
+        try:
+            with open(inventory_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError as exc:
+            print('[WARN] Inventario invalido, ignorando (%s): %s' % (inventory_file, exc))
+    return dict()
+
+
+# -----------------------------------------------------------------------------
+def plotGraph(path, file, metrics):
+    """
+    Cria um grafico com os dados recebidos.
+    """
+    import matplotlib.pyplot as plt
+
+    fontLegend = {'family': 'serif', 'color': 'black', 'size': 14}
+    for (graphs, legend_y) in readGraphs():
+        plot_grapth = False
+        for (metric_name, color) in graphs:
+            if metric_name in metrics:
+                plot_grapth = True
+                plt.rcParams['figure.figsize'] = [9, 2.5]
+                plt.plot(
+                    metrics[metric_name]['values']['x'],
+                    metrics[metric_name]['values']['y'],
+                    color=color,
+                    linestyle='solid',
+                    linewidth=1,
+                    label=('%s | mim:%.2f, avg:%.2f, max:%.2f' % (
+                        metric_name,
+                        metrics[metric_name]['min'],
+                        metrics[metric_name]['avg'],
+                        metrics[metric_name]['max'])
                     )
-                    plt.close()
-    f.close
+                )
+
+        if plot_grapth:
+            plt.legend(bbox_to_anchor=(
+                0, 1.02, 1, 0.2), loc="lower left", mode="expand", borderaxespad=0, ncol=3)
+
+            plt.ylabel(legend_y, fontdict=fontLegend)
+            plt.xlabel("Timeaxis (day)", fontdict=fontLegend)
+            # plt.ylim(0, 100)
+            plt.savefig(
+                fname=(('%s/%s_%s.png') % (path, file, metric_name)),
+                dpi=100,
+                bbox_inches='tight',
+                pad_inches=0.1,
+                transparent=False
+            )
+            plt.close()
 
 # -----------------------------------------------------------------------------
 def getMetrics(monitoring_client, query, namespace, compartment):
@@ -247,6 +546,224 @@ class PDF(FPDF):
             self.cell(0, 10, 'Page ' + str(self.page_no()) +
                       '/{nb}', 0, 0, 'C')
 
+    # Titulo e subtitulo de cada grafico
+    def graph_title(self, host, path):
+        # ---------------------------------------------------------------------
+        # Titulo do grafico:
+        self.set_text_color(r=0, g=0, b=255)
+        self.set_font(family='Arial', style='B', size=17)
+        self.cell(
+            w=0,  # Largura
+            h=8,  # Altura
+            ln=1,
+            border=0,
+            txt=('Instance: %s' % host),
+        )
+
+        # ---------------------------------------------------------------------
+        # Subtitulo do grafico (compartment full path)
+        self.set_text_color(r=200, g=-1, b=-1)
+        self.set_font(family='Arial', style='I', size=9)
+        self.cell(
+            w=0,  # Largura
+            h=4,  # Altura
+            ln=1,
+            border=0,
+            txt=path
+        )
+
+    # Grafico de linhas desenhado diretamente no PDF (vetorial)
+    def graph(self, metrics, graphs, legend_y, w=190, h=71):
+        """
+        Desenha o grafico com as primitivas do FPDF, sem passar por
+        imagens PNG. graphs e a lista de (metrica, cor) do arquivo .graphs
+        e as series de metrics ja devem estar reduzidas (downsample).
+        """
+        series = list()
+        for (index, (metric_name, line_color)) in enumerate(graphs):
+            if metric_name in metrics and metrics[metric_name]['values']:
+                series.append((
+                    metric_name,
+                    graph_color(line_color, index),
+                    metrics[metric_name]['values'],
+                    metrics[metric_name]
+                ))
+        if len(series) == 0:
+            return
+
+        if self.get_y() + h > self.page_break_trigger:
+            self.add_page(orientation=self.cur_orientation)
+        x0 = self.get_x()
+        y0 = self.get_y()
+
+        # ---------------------------------------------------------------------
+        # Legenda (3 colunas) com min/avg/max de cada metrica:
+        self.set_font('Arial', '', 7)
+        self.set_text_color(r=0, g=0, b=0)
+        self.set_line_width(0.4)
+        column = w / 3
+        for (index, (metric_name, rgb, values, metric)) in enumerate(series):
+            lx = x0 + (index % 3) * column
+            ly = y0 + 3 + (index // 3) * 4
+            self.set_draw_color(*rgb)
+            self.line(lx, ly - 1, lx + 5, ly - 1)
+            self.text(lx + 6, ly, '%s | mim:%.2f, avg:%.2f, max:%.2f' % (
+                metric_name, metric['min'], metric['avg'], metric['max']))
+        legend_h = 4 * ((len(series) + 2) // 3) + 3
+
+        # ---------------------------------------------------------------------
+        # Area do grafico:
+        px = x0 + 14
+        py = y0 + legend_h
+        pw = w - 16
+        ph = h - legend_h - 10
+
+        x_min = min([v['x'][0].timestamp() for (n, c, v, m) in series])
+        x_max = max([v['x'][-1].timestamp() for (n, c, v, m) in series])
+        y_min = min([0] + [min(v['y']) for (n, c, v, m) in series])
+        y_max = max([max(v['y']) for (n, c, v, m) in series])
+        if x_max <= x_min:
+            x_max = x_min + 1
+        if y_max <= y_min:
+            y_max = y_min + 1
+        y_max += (y_max - y_min) * 0.05
+
+        # ---------------------------------------------------------------------
+        # Grade e marcacoes do eixo Y:
+        self.set_line_width(0.1)
+        self.set_font('Arial', '', 6)
+        ticks = 5
+        for tick in range(ticks + 1):
+            value = y_min + (y_max - y_min) * tick / ticks
+            ty = py + ph - ph * tick / ticks
+            self.set_draw_color(220, 220, 220)
+            self.line(px, ty, px + pw, ty)
+            label = '%.1f' % value
+            self.text(px - 1 - self.get_string_width(label), ty + 1, label)
+
+        # ---------------------------------------------------------------------
+        # Marcacoes do eixo X:
+        for tick in range(ticks + 1):
+            value = x_min + (x_max - x_min) * tick / ticks
+            tx = px + pw * tick / ticks
+            self.set_draw_color(220, 220, 220)
+            self.line(tx, py, tx, py + ph)
+            label = datetime.fromtimestamp(value, timezone.utc).strftime('%d/%m %H:%M')
+            self.text(tx - self.get_string_width(label) / 2, py + ph + 3, label)
+
+        # ---------------------------------------------------------------------
+        # Eixos e legendas dos eixos:
+        self.set_draw_color(0, 0, 0)
+        self.rect(px, py, pw, ph)
+        self.set_font('Arial', 'I', 7)
+        self.text(x0, py - 1, legend_y)
+        label = 'Timeaxis (day)'
+        self.text(px + (pw - self.get_string_width(label)) / 2, py + ph + 7, label)
+
+        # ---------------------------------------------------------------------
+        # Linhas de cada metrica:
+        self.set_line_width(0.25)
+        for (metric_name, rgb, values, metric) in series:
+            self.set_draw_color(*rgb)
+            points = [(
+                px + pw * (x.timestamp() - x_min) / (x_max - x_min),
+                py + ph - ph * (y - y_min) / (y_max - y_min)
+            ) for (x, y) in zip(values['x'], values['y'])]
+            for (start, end) in zip(points, points[1:]):
+                self.line(start[0], start[1], end[0], end[1])
+
+        self.set_draw_color(0, 0, 0)
+        self.set_line_width(0.2)
+        self.set_xy(x0, y0 + h)
+
+# -----------------------------------------------------------------------------
+def graph_color(name, index=0):
+    """
+    Converte o nome da cor usado no arquivo .graphs (ou #rrggbb)
+    para RGB. Cores desconhecidas geram um aviso e usam a cor padrao
+    da posicao (index) da serie no grafico.
+    """
+    name = name.strip().lower()
+    if re.match('^#[0-9a-f]{6}$', name):
+        return (int(name[1:3], 16), int(name[3:5], 16), int(name[5:7], 16))
+    if name in graph_colors:
+        return graph_colors[name]
+    if not name in graph_colors_warned:
+        graph_colors_warned.add(name)
+        print('[WARN] Cor desconhecida no arquivo .graphs: %s' % (name))
+    return graph_default_colors[index % len(graph_default_colors)][1]
+
+# -----------------------------------------------------------------------------
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """
+    Endpoint HTTP do modo servico. Publica os arquivos do ultimo relatorio
+    gerado e os dados de cada instance em JSON.
+    """
+    content_types = {
+        'csv': 'text/csv',
+        'pdf': 'application/pdf',
+        'zip': 'application/zip'
+    }
+
+    def do_GET(self):
+        with report_lock:
+            report = dict(latest_report)
+        path = self.path.split('?')[0].rstrip('/')
+
+        if len(report) == 0:
+            self.send_json(503, {'error': 'report not ready'})
+        elif path == '':
+            self.send_json(200, {
+                'generated': report['generated'],
+                'instances': len(report['instances']),
+                'endpoints': ['/instances', '/instances/<ocid>'] + ['/%s' % (name) for name in report['files']]
+            })
+        elif path == '/instances':
+            self.send_json(200, [
+                {key: value for (key, value) in instance.items() if key != 'metrics'}
+                for instance in report['instances'].values()
+            ])
+        elif path.startswith('/instances/'):
+            ocid = path[len('/instances/'):]
+            if ocid in report['instances']:
+                self.send_json(200, report['instances'][ocid])
+            else:
+                self.send_json(404, {'error': 'instance not found'})
+        elif path[1:] in report['files']:
+            self.send_body(200, self.content_types[path.split('.')[-1]], report['files'][path[1:]])
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def send_json(self, status, data):
+        self.send_body(status, 'application/json', json.dumps(data, default=str).encode('utf-8'))
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# -----------------------------------------------------------------------------
+def start_service():
+    """
+    Inicia o endpoint HTTP e executa a coleta a cada service_interval
+    minutos, reutilizando os clients entre as execucoes (o cache de
+    consultas por ocid vale apenas para uma coleta).
+    """
+    server = ThreadingHTTPServer((service_address, service_port), ReportRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print('# Modo servico: http://%s:%s/ (coleta a cada %s minutos)' % (service_address, service_port, service_interval))
+
+    while True:
+        started = time.time()
+        try:
+            run_report()
+        except Exception as exc:
+            print(exc)
+            print(color['red'], 'Falha na coleta... (⊙.☉)7', color['clean'])
+        time.sleep(max(0, (service_interval * 60) - (time.time() - started)))
+
 # Bustable base line list:
 burstable = {
     'BASELINE_1_8': "12.5%",
@@ -265,6 +782,101 @@ burstable = {
 time_range = 1 # Tempo em dias. Valores possiveis entre 1-90
 aggregation = '5m' # Valores possiveis: 1m, 5m, 1h, 1d
 
+# Renderizacao dos graficos no PDF:
+#  - vector: desenha os graficos diretamente no PDF (rapido e arquivo menor)
+#  - matplotlib: gera imagens PNG com o matplotlib e as insere no PDF
+graph_renderer = 'vector'
+graph_max_points = 400 # Maximo de pontos por serie no grafico vetorial (0 = todos)
+
+# Cores aceitas no arquivo .graphs pelo renderizador vetorial:
+graph_colors = {
+    'black': (0, 0, 0),
+    'red': (255, 0, 0),
+    'green': (0, 128, 0),
+    'blue': (0, 0, 255),
+    'yellow': (255, 191, 0),
+    'orange': (255, 165, 0),
+    'purple': (128, 0, 128),
+    'magenta': (255, 0, 255),
+    'cyan': (0, 191, 191),
+    'gray': (128, 128, 128),
+    'grey': (128, 128, 128),
+    'brown': (165, 42, 42),
+    'pink': (255, 192, 203),
+    'olive': (128, 128, 0),
+    'navy': (0, 0, 128),
+    'teal': (0, 128, 128),
+    'lime': (0, 255, 0),
+    'darkred': (139, 0, 0),
+    'darkgreen': (0, 100, 0),
+    'darkblue': (0, 0, 139),
+    'darkorange': (255, 140, 0),
+    'lightblue': (173, 216, 230),
+    'lightgreen': (144, 238, 144),
+    # Cores de uma letra do matplotlib:
+    'b': (0, 0, 255),
+    'g': (0, 128, 0),
+    'r': (255, 0, 0),
+    'c': (0, 191, 191),
+    'm': (191, 0, 191),
+    'y': (191, 191, 0),
+    'k': (0, 0, 0),
+    'w': (255, 255, 255)
+}
+
+# Ciclo de cores padrao do matplotlib (C0..C9 e tab:*), usado tambem para
+# cores desconhecidas no arquivo .graphs:
+graph_default_colors = [
+    ('tab:blue', (31, 119, 180)),
+    ('tab:orange', (255, 127, 14)),
+    ('tab:green', (44, 160, 44)),
+    ('tab:red', (214, 39, 40)),
+    ('tab:purple', (148, 103, 189)),
+    ('tab:brown', (140, 86, 75)),
+    ('tab:pink', (227, 119, 194)),
+    ('tab:gray', (127, 127, 127)),
+    ('tab:olive', (188, 189, 34)),
+    ('tab:cyan', (23, 190, 207))
+]
+for (index, (tab_name, rgb)) in enumerate(graph_default_colors):
+    graph_colors[tab_name] = rgb
+    graph_colors['c%s' % (index)] = rgb
+graph_colors['tab:grey'] = graph_colors['tab:gray']
+graph_colors_warned = set()
+
+
+# Diretorio do inventario usado para consultar novamente apenas as instances
+# novas ou alteradas desde a ultima coleta:
+inventory_dir = './inventory'
+inventory_max_age = 7 # Tempo em dias ate consultar novamente uma instance sem mudancas
+
+# Modo servico:
+service_address = '127.0.0.1'
+service_port = 8080
+service_interval = 60 # Intervalo em minutos entre as coletas
+
+# -----------------------------------------------------------------------------
+# Clients e ultimo relatorio mantidos entre as coletas e consultas por
+# ocid feitas durante a coleta:
+client_registry = dict()
+client_stats = {'created': 0, 'reused': 0}
+lookup_cache = {
+    'image': dict(),
+    'capacity_reservation': dict(),
+    'dedicated_vm_host': dict()
+}
+latest_report = dict()
+report_lock = threading.Lock()
+
+# -----------------------------------------------------------------------------
+# Colunas do arquivo csv com a lista de instances:
+instance_list_header = [
+    'compartment', 'instance_name', 'os_name', 'os_version', 'region',
+    'lifecycle_state', 'shape', 'burstable', 'preemptible', 'reservation',
+    'dedicated_host', 'processor_description', 'ocpus', 'memory_in_gbs',
+    'boot_image_name', 'boot_size', 'boot_vpu', 'block_count', 'block_size',
+    'block_vpu_sum', 'age(days)', 'ocid'
+]
 
 # -----------------------------------------------------------------------------
 # lista de cores para output do script:
@@ -278,10 +890,7 @@ color = {
 
 # -----------------------------------------------------------------------------
 # Intancia o Identity client :
-if 'signer' in vars() or 'signer' in globals():
-    identity_client = oci.identity.IdentityClient(signer=signer, config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
-else:
-    identity_client = oci.identity.IdentityClient(config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
+identity_client = get_client(oci.identity.IdentityClient)
 
 # -----------------------------------------------------------------------------
 # Lista todas as regioes nas quais o tanancy esta subscrito:
@@ -292,255 +901,191 @@ regions = identity_client.list_region_subscriptions(oci_config['tenancy']).data
 tenancy_name = (identity_client.get_tenancy(oci_config['tenancy']).data.name).strip()
 
 # -----------------------------------------------------------------------------
-# Diretorio para gravacao temporaria das imagens:
-work_dir = 'work_dir'
-file_path = ('./%s/%s' % (work_dir, tenancy_name))
-if not exists(file_path):
-    os.makedirs(file_path)
-else:
-    for i in os.listdir(file_path):
-        os.remove(os.path.join(file_path, i))
-
-# -----------------------------------------------------------------------------
-# Diretorio para gravacao dos arquivos zip de report:
-report_dir = './reports'
-if not exists(report_dir):
-    os.makedirs(report_dir)
-
-
-# -----------------------------------------------------------------------------
-# Monta o nome do arquivo de output com a lista de instances encontrdas:
-today = datetime.now()
-instance_list_file = ('%s/%s_instance_list_%s.csv' % (file_path, tenancy_name, today.strftime("%Y-%m-%d_%H-%M-%S")))
-instance_perfornace_file = ('%s/%s_instance_perfornace_data_%s-%s_days.csv' % (file_path, tenancy_name, today.strftime("%Y-%m-%d_%H-%M-%S"), time_range))
-instance_perfornace_report = ('%s/%s_instance_perfornace_data_%s-%s_days.pdf' % (file_path, tenancy_name, today.strftime("%Y-%m-%d_%H-%M-%S"), time_range))
-zip_output_file = ('./%s/%s_%s_performance_report-%s_days.zip' % (report_dir, today.strftime("%Y-%m-%d_%H-%M-%S"), tenancy_name, time_range))
-
-# -----------------------------------------------------------------------------
-# Range de tempo para a coleta de dados de performance com o cliente de
-# monitoracao:
-today_utc = datetime.now(timezone.utc)
-start_time = datetime.strptime((today_utc-timedelta(days=time_range)).strftime("%Y-%m-%dT%H:%M:%S.%fZ"), "%Y-%m-%dT%H:%M:%S.%fZ")
-end_time = datetime.strptime(today_utc.strftime("%Y-%m-%dT%H:%M:%S.%fZ"), "%Y-%m-%dT%H:%M:%S.%fZ")
-
-# -----------------------------------------------------------------------------
-# Grava o header nos arquivos csv:
-with open(instance_list_file, 'w', encoding='utf-8') as f:
-    f.write('compartment,instance_name,os_name,os_version,region,lifecycle_state,shape,burstable,preemptible,reservation,dedicated_host,processor_description,ocpus,memory_in_gbs,boot_image_name,boot_size,boot_vpu,block_count,block_size,block_vpu_sum,age(days),ocid\n')
-f.close
+def run_report():
+    """
+    Executa uma coleta completa e gera os arquivos csv, pdf e zip do
+    relatorio.
+    """
+    global start_time, end_time
 
-# -----------------------------------------------------------------------------
-# Inicia a varedura do tenancy vasculhando dentro de cada compartment em todas
-# as regions que o tenancy esta subscrito:
-compartment_path = dict()
-header_csv_perf_report = True
-
-region_count = 0
-region_count_total = len(regions)
-for region_name in [str(es.region_name) for es in regions]:
-    region_count += 1
-    print('> [%02d/%02d] %s%s%s' % (region_count, region_count_total, color['blue'], region_name, color['clean']))
-    oci_config['region'] = region_name
+    # -------------------------------------------------------------------------
+    # As consultas por ocid valem apenas para esta coleta, para que nomes
+    # alterados (images, reservations e dedicated hosts) sejam atualizados:
+    for kind in lookup_cache:
+        lookup_cache[kind].clear()
 
     # -------------------------------------------------------------------------
-    # Intancia o Compute client :
-    if 'signer' in vars() or 'signer' in globals():
-        compute_client = oci.core.ComputeClient(signer=signer, config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
-        monitoring_client = oci.monitoring.MonitoringClient(signer=signer, config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
-        blockStorage_client = oci.core.BlockstorageClient(signer=signer, config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
-        identity_client = oci.identity.IdentityClient(signer=signer, config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
+    # Diretorio para gravacao temporaria das imagens:
+    work_dir = 'work_dir'
+    file_path = ('./%s/%s' % (work_dir, tenancy_name))
+    if not exists(file_path):
+        os.makedirs(file_path)
     else:
-        compute_client = oci.core.ComputeClient(config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
-        monitoring_client = oci.monitoring.MonitoringClient(config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
-        blockStorage_client = oci.core.BlockstorageClient(config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
-        identity_client = oci.identity.IdentityClient(config=oci_config, retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY)
+        for i in os.listdir(file_path):
+            os.remove(os.path.join(file_path, i))
 
     # -------------------------------------------------------------------------
-    # Inicia o processamento analisando cada compartment do tenancy:
-    volumeAttachmentList = {'boot': dict(), 'block': dict()}
-    print('  + Making data cache +')
-    for compartment in get_compartments(compartment_ocid):
-
-        # Cria uma lista de boot/block volumes attachments para
-        # consulta posterior e identificar o volume associado
-        # a cada instance:
-        for availability_domain in identity_client.list_availability_domains(compartment_id=compartment['id']).data:
-            # Boot volume:
-            for attachment in oci.pagination.list_call_get_all_results(
-                compute_client.list_boot_volume_attachments,
-                availability_domain=availability_domain.name,
-                compartment_id=compartment['id']
-            ).data:
-                if not attachment.instance_id in volumeAttachmentList['boot']:
-                    volumeAttachmentList['boot'][attachment.instance_id] = list(
-                    )
-                volumeAttachmentList['boot'][attachment.instance_id] = {
-                    'id': attachment.boot_volume_id,
-                    'compartment_id': attachment.compartment_id,
-                    'availability_domain': attachment.availability_domain,
-                    'lifecycle_state': attachment.lifecycle_state
-                }
-
-            # Block volume:
-            for attachment in compute_client.list_volume_attachments(
-                    availability_domain=availability_domain.name,
-                    compartment_id=compartment['id']
-            ).data:
-                if not attachment.instance_id in volumeAttachmentList['block']:
-                    volumeAttachmentList['block'][attachment.instance_id] = list(
-                    )
-                volumeAttachmentList['block'][attachment.instance_id].append(attachment)
-
-    if len(volumeAttachmentList['boot']) == 0:
-        print('  `-> No instances found! %s¯\_(%s⊙%s︿%s⊙%s)_/¯%s\n' % (color['yellow'], color['red'], color['green'], color['red'], color['yellow'], color['clean']))
-        continue
+    # Diretorio para gravacao dos arquivos zip de report:
+    report_dir = './reports'
+    if not exists(report_dir):
+        os.makedirs(report_dir)
 
     # -------------------------------------------------------------------------
-    # Inicia o processamento analisando cada compartment do tenancy:
-    for compartment in get_compartments(compartment_ocid):
-        print('  - %s' % (compartment['name']))
+    # Diretorio para gravacao do inventario entre as coletas:
+    if not exists(inventory_dir):
+        os.makedirs(inventory_dir)
 
-        for instance in get_instance(compute_client, compartment['id']):
-            compartment_path[instance.id] = (
-                '[%s] %s' % (region_name, compartment['name']))
-            time_created = datetime.strptime(
-                str(instance.time_created).split(" ")[0], "%Y-%m-%d")
 
-            # -----------------------------------------------------------------
-            # Validacao do tipo da instance:
-            instanceJson = json.loads(str(instance))
-            instanceType = {
-                'burstable': 'none',
-                'preemptible': 'none',
-                'dedicated_vm_host': 'none',
-                'capacity_reservation': 'none'
-            }
-            if instanceJson['shape_config']['baseline_ocpu_utilization']:
-                instanceType['burstable'] = burstable[instanceJson['shape_config']
-                                                      ['baseline_ocpu_utilization']]
-            if instanceJson['preemptible_instance_config']:
-                instanceType['preemptible'] = 'yes'
-            if instanceJson['capacity_reservation_id']:
-                capacityReservationResponse = compute_client.get_compute_capacity_reservation(
-                    capacity_reservation_id=instanceJson['capacity_reservation_id']
-                ).data
-                instanceType['capacity_reservation'] = (capacityReservationResponse.display_name).strip()
-            if instanceJson['dedicated_vm_host_id']:
-                dedicatedVmHostResponse = compute_client.get_dedicated_vm_host(
-                    dedicated_vm_host_id=instanceJson['dedicated_vm_host_id']
-                ).data
-                instanceType['dedicated_vm_host'] = (dedicatedVmHostResponse.display_name).strip()
+    # -------------------------------------------------------------------------
+    # Monta o nome do arquivo de output com a lista de instances encontrdas:
+    today = datetime.now()
+    instance_list_file = ('%s/%s_instance_list_%s.csv' % (file_path, tenancy_name, today.strftime("%Y-%m-%d_%H-%M-%S")))
+    instance_perfornace_file = ('%s/%s_instance_perfornace_data_%s-%s_days.csv' % (file_path, tenancy_name, today.strftime("%Y-%m-%d_%H-%M-%S"), time_range))
+    instance_perfornace_report = ('%s/%s_instance_perfornace_data_%s-%s_days.pdf' % (file_path, tenancy_name, today.strftime("%Y-%m-%d_%H-%M-%S"), time_range))
+    zip_output_file = ('./%s/%s_%s_performance_report-%s_days.zip' % (report_dir, today.strftime("%Y-%m-%d_%H-%M-%S"), tenancy_name, time_range))
 
-            # -----------------------------------------------------------------
-            # Lista de informacoes para coleta dos volumes da instance
-            # (boot e block)
-            volumes = {
-                'boot': {'size': 'null', 'vpu': 'null', 'image': '', 'os': {'name': '', 'version': ''}},
-                'block': list()
-            }
-            # -------------------------------------------------------------
-            # Procura por Boot Volume:
-            if instance.id in volumeAttachmentList['boot']:
-                bootVolumeResponse = blockStorage_client.get_boot_volume(
-                    boot_volume_id=volumeAttachmentList['boot'][instance.id]['id']
-                ).data
-                
-                volumes['boot']['image'] = (bootVolumeResponse.display_name).strip()
-                volumes['boot']['size'] = bootVolumeResponse.size_in_gbs
-                volumes['boot']['vpu'] = bootVolumeResponse.vpus_per_gb
-
-                # --------------------------------------------------------
-                # Verifica se o boot volume utilizado nao foi criado em
-                # outra regiao e transferido para essa. nesses cassos
-                # o boot volume preserva o ocid da imagem de origem,
-                # sendo assim, necessario alterar a regiao
-                # no client para consultar essa image.
-                region_object = re.search('^ocid1\.image.oc1.(.*)\.', bootVolumeResponse.image_id, re.IGNORECASE).group(1)
-                if len(region_object) > 0:
-                    if region_object != oci_config['region']:
-                        oci_conf = oci.config.from_file(config_file, 'DEFAULT')
-                        oci_conf['region'] = region_object
-                        if 'signer' in vars() or 'signer' in globals():
-                            imageResponse = oci.core.ComputeClient(signer=signer,config=oci_conf,retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).get_image(
-                                image_id=bootVolumeResponse.image_id
-                            ).data
-                        else:
-                            imageResponse = oci.core.ComputeClient(config=oci_conf,retry_strategy=oci.retry.DEFAULT_RETRY_STRATEGY).get_image(
-                                image_id=bootVolumeResponse.image_id
-                            ).data
-                        del oci_conf
-                    else:
-                        imageResponse = compute_client.get_image(
-                            image_id=bootVolumeResponse.image_id
-                        ).data
-                else:
-                    try:
-                        imageResponse = compute_client.get_image(
-                            image_id=bootVolumeResponse.image_id
-                        ).data
-                    except Exception as exc:
-                        print(exc)
-                        print('boot volume: %s\nocid:\n%s' % ((bootVolumeResponse.display_name).strip(), bootVolumeResponse.image_id))
-                        print(color['red'], 'O que aconteceu... (⊙.☉)7')
-                        volumes['boot']['image'] = 'no_data'
-                        volumes['boot']['os']['name'] = 'no_data'
-                        volumes['boot']['os']['version'] = 'no_data'
-                        pass
-
-                volumes['boot']['image'] = (imageResponse.display_name).strip()
-                volumes['boot']['os']['name'] = imageResponse.operating_system
-                volumes['boot']['os']['version'] = imageResponse.operating_system_version
-                del(imageResponse, bootVolumeResponse)
+    # -------------------------------------------------------------------------
+    # Range de tempo para a coleta de dados de performance com o cliente de
+    # monitoracao:
+    today_utc = datetime.now(timezone.utc)
+    start_time = datetime.strptime((today_utc-timedelta(days=time_range)).strftime("%Y-%m-%dT%H:%M:%S.%fZ"), "%Y-%m-%dT%H:%M:%S.%fZ")
+    end_time = datetime.strptime(today_utc.strftime("%Y-%m-%dT%H:%M:%S.%fZ"), "%Y-%m-%dT%H:%M:%S.%fZ")
 
-            else:
-                print(instance.display_name, "onde esta o boot volume dessa maquina !!!!")
-                print( instance.id)
-                sys.exit(0)
-
-            # -------------------------------------------------------------
-            # Procura por Block Volume:
-            if instance.id in volumeAttachmentList['block']:
-                for Attachment in volumeAttachmentList['block'][instance.id]:
-                    # -------------------------------------------------
-                    # Podem existir boot volumes anexados como block 
-                    # volumes.Nesse caso precisamos verificar o ocid 
-                    # para utilizar a chamada correta da API e pegar
-                    # as informacoes do volume.
-                    try:
-                        if re.match('^(ocid1\.bootvolume).*', str(Attachment.volume_id)):
-                            # ocid1.bootvolume....
-                            volumeResponse = blockStorage_client.get_boot_volume(
-                                boot_volume_id=Attachment.volume_id
-                            ).data
-                        elif re.match('^(ocid1\.volume).*', str(Attachment.volume_id)):
-                            # ocid1.volume.oc1....
-                            volumeResponse = blockStorage_client.get_volume(
-                                volume_id=Attachment.volume_id
-                            ).data
-                        volumes['block'].append({
-                            'name': (volumeResponse.display_name).strip(),
-                            'size': volumeResponse.size_in_gbs,
-                            'vpu': volumeResponse.vpus_per_gb
-                        })
-                        del(volumeResponse)
-                    except Exception as exc:
-                        print(exc)
-                        print('instance: %s\nblock_volume_info:\n%s' % ((instance.display_name).strip(), Attachment))
-                        print(color['red'], 'O que aconteceu... (⊙.☉)7')
-                        pass
+    # -------------------------------------------------------------------------
+    # Grava o header nos arquivos csv:
+    with open(instance_list_file, 'w', encoding='utf-8') as f:
+        f.write('%s\n' % (','.join(instance_list_header)))
+    f.close
 
-            # -----------------------------------------------------------------
-            # Sumarizacao das informacoes de block storage:
-            block_size = 0
-            block_vpu_sum = 0
-            for block in volumes['block']:
-                block_size += block['size']
-                block_vpu_sum += (block['size']*block['vpu'])
+    # -------------------------------------------------------------------------
+    # Inventario da coleta anterior (apenas instances novas, alteradas ou com
+    # dados mais antigos que inventory_max_age dias sao consultadas novamente):
+    inventory_file = ('%s/%s_inventory.json' % (inventory_dir, tenancy_name))
+    inventory = load_inventory(inventory_file)
+    inventory_expire = (today-timedelta(days=inventory_max_age)).strftime("%Y-%m-%d %H:%M:%S")
+    newInventory = dict()
+    inventory_reused = 0
 
-            # -----------------------------------------------------------------
-            # Grava os dados da instance encontrada no arquivo csv de output:
-            with open(instance_list_file, 'a', encoding='utf-8') as f:
-                f.write('%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s\n' % (
+    # -------------------------------------------------------------------------
+    # Inicia a varedura do tenancy vasculhando dentro de cada compartment em todas
+    # as regions que o tenancy esta subscrito:
+    compartments = get_compartments(compartment_ocid)
+    compartment_path = dict()
+    header_csv_perf_report = True
+    instanceGraphs = list()
+    instanceData = dict()
+
+    region_count = 0
+    region_count_total = len(regions)
+    for region_name in [str(es.region_name) for es in regions]:
+        region_count += 1
+        print('> [%02d/%02d] %s%s%s' % (region_count, region_count_total, color['blue'], region_name, color['clean']))
+        oci_config['region'] = region_name
+
+        # ---------------------------------------------------------------------
+        # Clients da regiao (reutilizados entre as coletas):
+        (compute_client, monitoring_client, blockStorage_client, identity_client) = get_clients(region_name)
+
+        # ---------------------------------------------------------------------
+        # Inicia o processamento analisando cada compartment do tenancy:
+        volumeAttachmentList = {'boot': dict(), 'block': dict()}
+        print('  + Making data cache +')
+        for compartment in compartments:
+
+            # Cria uma lista de boot/block volumes attachments para
+            # consulta posterior e identificar o volume associado
+            # a cada instance:
+            for availability_domain in identity_client.list_availability_domains(compartment_id=compartment['id']).data:
+                # Boot volume:
+                for attachment in oci.pagination.list_call_get_all_results(
+                    compute_client.list_boot_volume_attachments,
+                    availability_domain=availability_domain.name,
+                    compartment_id=compartment['id']
+                ).data:
+                    if not attachment.instance_id in volumeAttachmentList['boot']:
+                        volumeAttachmentList['boot'][attachment.instance_id] = list(
+                        )
+                    volumeAttachmentList['boot'][attachment.instance_id] = {
+                        'id': attachment.boot_volume_id,
+                        'compartment_id': attachment.compartment_id,
+                        'availability_domain': attachment.availability_domain,
+                        'lifecycle_state': attachment.lifecycle_state
+                    }
+
+                # Block volume:
+                for attachment in compute_client.list_volume_attachments(
+                        availability_domain=availability_domain.name,
+                        compartment_id=compartment['id']
+                ).data:
+                    if not attachment.instance_id in volumeAttachmentList['block']:
+                        volumeAttachmentList['block'][attachment.instance_id] = list(
+                        )
+                    volumeAttachmentList['block'][attachment.instance_id].append(attachment)
+
+        if len(volumeAttachmentList['boot']) == 0:
+            print('  `-> No instances found! %s¯\_(%s⊙%s︿%s⊙%s)_/¯%s\n' % (color['yellow'], color['red'], color['green'], color['red'], color['yellow'], color['clean']))
+            continue
+
+        # ---------------------------------------------------------------------
+        # Inicia o processamento analisando cada compartment do tenancy:
+        for compartment in compartments:
+            print('  - %s' % (compartment['name']))
+
+            for instance in get_instance(compute_client, compartment['id']):
+                compartment_path[instance.id] = (
+                    '[%s] %s' % (region_name, compartment['name']))
+                time_created = datetime.strptime(
+                    str(instance.time_created).split(" ")[0], "%Y-%m-%d")
+
+                # -------------------------------------------------------------
+                # Reutiliza o inventario da coleta anterior se a instance nao
+                # mudou (estado, shape e volumes anexados) e se os dados foram
+                # consultados ha menos de inventory_max_age dias (tamanho e
+                # VPU dos volumes podem mudar sem alterar os attachments):
+                signature = get_instance_signature(instance, volumeAttachmentList)
+                if (
+                    instance.id in inventory
+                    and inventory[instance.id]['signature'] == signature
+                    and inventory[instance.id].get('saved', '') >= inventory_expire
+                ):
+                    instanceType = inventory[instance.id]['instanceType']
+                    volumes = inventory[instance.id]['volumes']
+                    saved = inventory[instance.id]['saved']
+                    complete = True
+                    inventory_reused += 1
+                else:
+                    instanceDetails = get_instance_details(
+                        instance=instance,
+                        volumeAttachmentList=volumeAttachmentList,
+                        compute_client=compute_client,
+                        blockStorage_client=blockStorage_client
+                    )
+                    if not instanceDetails:
+                        continue
+                    (instanceType, volumes, complete) = instanceDetails
+                    saved = today.strftime("%Y-%m-%d %H:%M:%S")
+
+                # Consultas com falha nao sao gravadas no inventario, para
+                # que a instance seja consultada novamente na proxima coleta:
+                if complete:
+                    newInventory[instance.id] = {
+                        'signature': signature,
+                        'instanceType': instanceType,
+                        'volumes': volumes,
+                        'saved': saved
+                    }
+
+                # -------------------------------------------------------------
+                # Sumarizacao das informacoes de block storage:
+                block_size = 0
+                block_vpu_sum = 0
+                for block in volumes['block']:
+                    block_size += block['size']
+                    block_vpu_sum += (block['size']*block['vpu'])
+
+                # -------------------------------------------------------------
+                # Grava os dados da instance encontrada no arquivo csv de output:
+                instanceRow = [
                     compartment['name'],
                     (instance.display_name).strip(),
                     volumes['boot']['os']['name'],
@@ -562,144 +1107,157 @@ for region_name in [str(es.region_name) for es in regions]:
                     block_size,
                     block_vpu_sum,
                     (datetime.now()-time_created).days,
-                    instance.id)
-                )
-            f.close
-
-            volumes = {
-                'boot': {'size': '', 'vpu': '', 'image': '', 'os': {'name': '', 'version': ''}},
-                'block': list()
-            }
-
-            allMetrics = dict()
-            listOfMetrics = str()
-            makeGraph = True
-            with open('.metric_query') as f:
-                lines = f.readlines()
-                for line in lines:
-                    if not re.match('^#', line):
-                        (type, query) = line.split('~')
-                        query = re.sub(
-                            "###AGGREGATION###", aggregation, query)
-                        query = re.sub(
-                            "###INSTANCE_OCID###", instance.id, query)
-
-                        (min, avg, max, values) = getMetrics(
-                            monitoring_client=monitoring_client,
-                            query=query,
-                            namespace='oci_computeagent',
-                            compartment=compartment['id']
-                        )
-                        if min:
-                            listOfMetrics=re.sub('(\, )$', '', f'{type}, {listOfMetrics}')
-                            allMetrics[type] = {'min': min, 'avg': avg, 'max': max, 'values': values}
-                        else:
-                            allMetrics[type] = {'min': 'no_data', 'avg': 'no_data', 'max': 'no_data', 'values': False}
-                            makeGraph = False
-
-                if makeGraph:
-                    print('    - [%s OK %s] Get metrics %s for %s' % (color['green'],color['clean'], listOfMetrics, (instance.display_name).strip()))
-                else:
-                    print('    - [%sWARN%s] No metric data for %s' %(color['yellow'], color['clean'], (instance.display_name).strip()))
-
-                # -----------------------------------------------------------------
-                # Grava os dados de perfornace da instance no arquivo csv:
-                header = str()
-                with open(instance_perfornace_file, 'a', encoding='utf-8') as f:
-                    csvWriter = csv.writer(f)
-                    if header_csv_perf_report:
-                        header = ['INSTANCE']
-                    row = [(instance.display_name).strip()]
-                    for metric_name in allMetrics:
-                        for type in allMetrics[metric_name]:
-                            if re.match('min|avg|max', type):
-                                row.append(allMetrics[metric_name][type])
-                                if header_csv_perf_report:
-                                    header.append(
-                                        (f'{metric_name}_{type}').upper())
-
-                    if header_csv_perf_report:
-                        csvWriter.writerow(header)
-                        header_csv_perf_report = False
-                    csvWriter.writerow(row)
+                    instance.id
+                ]
+                with open(instance_list_file, 'a', encoding='utf-8') as f:
+                    f.write('%s\n' % (','.join([str(field) for field in instanceRow])))
                 f.close
+                instanceData[instance.id] = dict(zip(instance_list_header, instanceRow))
 
-                if makeGraph:
-                    plotGraph(
-                        metrics=allMetrics,
-                        file=('%s~%s~%s' % (tenancy_name,(instance.display_name).strip(), instance.id)).lower(),
-                        path=file_path
-                    )
+                volumes = {
+                    'boot': {'size': '', 'vpu': '', 'image': '', 'os': {'name': '', 'version': ''}},
+                    'block': list()
+                }
 
+                allMetrics = dict()
+                listOfMetrics = str()
+                makeGraph = True
+                with open('.metric_query') as f:
+                    lines = f.readlines()
+                    for line in lines:
+                        if not re.match('^#', line):
+                            (type, query) = line.split('~')
+                            query = re.sub(
+                                "###AGGREGATION###", aggregation, query)
+                            query = re.sub(
+                                "###INSTANCE_OCID###", instance.id, query)
+
+                            (min, avg, max, values) = getMetrics(
+                                monitoring_client=monitoring_client,
+                                query=query,
+                                namespace='oci_computeagent',
+                                compartment=compartment['id']
+                            )
+                            if min:
+                                listOfMetrics=re.sub('(\, )$', '', f'{type}, {listOfMetrics}')
+                                allMetrics[type] = {'min': min, 'avg': avg, 'max': max, 'values': values}
+                            else:
+                                allMetrics[type] = {'min': 'no_data', 'avg': 'no_data', 'max': 'no_data', 'values': False}
+                                makeGraph = False
+
+                    if makeGraph:
+                        print('    - [%s OK %s] Get metrics %s for %s' % (color['green'],color['clean'], listOfMetrics, (instance.display_name).strip()))
+                    else:
+                        print('    - [%sWARN%s] No metric data for %s' %(color['yellow'], color['clean'], (instance.display_name).strip()))
+
+                    if service_mode:
+                        instanceData[instance.id]['metrics'] = dict()
+                        for metric_name in allMetrics:
+                            metric = allMetrics[metric_name]
+                            instanceData[instance.id]['metrics'][metric_name] = {
+                                'min': metric['min'],
+                                'avg': metric['avg'],
+                                'max': metric['max'],
+                                'values': metric['values'] and {
+                                    'x': [str(x) for x in metric['values']['x']],
+                                    'y': metric['values']['y']
+                                }
+                            }
+
+                    # -------------------------------------------------------------
+                    # Grava os dados de perfornace da instance no arquivo csv:
+                    header = str()
+                    with open(instance_perfornace_file, 'a', encoding='utf-8') as f:
+                        csvWriter = csv.writer(f)
+                        if header_csv_perf_report:
+                            header = ['INSTANCE']
+                        row = [(instance.display_name).strip()]
+                        for metric_name in allMetrics:
+                            for type in allMetrics[metric_name]:
+                                if re.match('min|avg|max', type):
+                                    row.append(allMetrics[metric_name][type])
+                                    if header_csv_perf_report:
+                                        header.append(
+                                            (f'{metric_name}_{type}').upper())
+
+                        if header_csv_perf_report:
+                            csvWriter.writerow(header)
+                            header_csv_perf_report = False
+                        csvWriter.writerow(row)
+                    f.close
+
+                    if makeGraph:
+                        if graph_renderer == 'vector':
+                            # Mantem apenas a serie reduzida que sera desenhada:
+                            for metric_name in allMetrics:
+                                allMetrics[metric_name]['values'] = downsample(allMetrics[metric_name]['values'], graph_max_points)
+                            instanceGraphs.append({
+                                'host': (instance.display_name).strip(),
+                                'ocid': instance.id,
+                                'metrics': allMetrics
+                            })
+                        else:
+                            plotGraph(
+                                metrics=allMetrics,
+                                file=('%s~%s~%s' % (tenancy_name,(instance.display_name).strip(), instance.id)).lower(),
+                                path=file_path
+                            )
 
-# -----------------------------------------------------------------
-# Inicia o processo de criacao do relatorio em PDF
-print('\n# Criando arquivo PDF: Processando graficos...')
-pdf = PDF('P', 'mm', 'A4')
-pdf.alias_nb_pages()
-pdf.add_page(orientation='P')
-pdf.set_author('igor nicoli at oracle dot com')
 
-# -----------------------------------------------------------------------------
-# Pagina de rosto (cover)
-pdf.set_font('Arial', 'BI', 30)
-pdf.cell(
-    ln=1,
-    w=189,  # Largura
-    h=265,  # Altura
-    border=0,
-    align="C",  # Alinhamento centralizado
-    txt="Instance Performance Report",
-)
+    # -------------------------------------------------------------------------
+    # Grava o inventario para a proxima coleta:
+    with open(inventory_file, 'w', encoding='utf-8') as f:
+        json.dump(newInventory, f)
+    print('\n# Inventario: %s de %s instances reutilizadas da coleta anterior' % (inventory_reused, len(newInventory)))
+    stats = get_client_stats()
+    print('# Clients: %s criados, %s reutilizados' % (stats['created'], stats['reused']))
+    for name in stats['clients']:
+        if stats['clients'][name]['requests'] is None:
+            print('  - %s: estatisticas de conexao indisponiveis' % (name))
+        else:
+            print('  - %s: %s requisicoes em %s conexoes' % (name, stats['clients'][name]['requests'], stats['clients'][name]['connections']))
+
+    # -------------------------------------------------------------
+    # Inicia o processo de criacao do relatorio em PDF
+    print('\n# Criando arquivo PDF: Processando graficos...')
+    pdf = PDF('P', 'mm', 'A4')
+    pdf.alias_nb_pages()
+    pdf.add_page(orientation='P')
+    pdf.set_author('igor nicoli at oracle dot com')
 
-# -----------------------------------------------------------------------------
-# Coloca as imagens no PDF
-# r=root, d=directories, f = files
-for r, d, f in os.walk(file_path):
-    countdown_files = (len(f)+1)
+    # -------------------------------------------------------------------------
+    # Pagina de rosto (cover)
+    pdf.set_font('Arial', 'BI', 30)
+    pdf.cell(
+        ln=1,
+        w=189,  # Largura
+        h=265,  # Altura
+        border=0,
+        align="C",  # Alinhamento centralizado
+        txt="Instance Performance Report",
+    )
+
+    # -------------------------------------------------------------------------
+    # Desenha os graficos vetoriais no PDF
     count = 0
-    for file_name in f:
+    graphList = readGraphs()
+    countdown_files = len(instanceGraphs)+1
+    for instanceGraph in instanceGraphs:
         countdown_files -= 1
-        if re.match(('^%s.*\.png$' % (tenancy_name)), file_name):
+        print(' - [%s%03d%s] %s' %
+              (color['blue'], countdown_files, color['clean'], instanceGraph['host']))
+        for (graphs, legend_y) in graphList:
+            if not any(metric_name in instanceGraph['metrics'] for (metric_name, line_color) in graphs):
+                continue
             count += 1
-            (tenancy, host, ocid) = file_name.split('~')
-            print(' - [%s%03d%s] %s' %
-                  (color['blue'], countdown_files, color['clean'], host))
-
-            # -----------------------------------------------------------------
-            # Titulo do grafico:
-            pdf.set_text_color(r=0, g=0, b=255)
-            pdf.set_font(family='Arial', style='B', size=17)
-            pdf.cell(
-                w=0,  # Largura
-                h=8,  # Altura
-                ln=1,
-                border=0,
-                txt=('Instance: %s' % host),
-            )
 
             # -----------------------------------------------------------------
-            # Subtitulo do grafico (compartment full path)
-            pdf.set_text_color(r=200, g=-1, b=-1)
-            pdf.set_font(family='Arial', style='I', size=9)
-            pdf.cell(
-                w=0,  # Largura
-                h=4,  # Altura
-                ln=1,
-                border=0,
-                txt=compartment_path[ocid.split('_')[0]]
-            )
-
-            # -----------------------------------------------------------------
-            # Coloca o grafico da instance no PDF:
-            pdf.image(
-                h=71,   # Altura
-                w=190,  # Largura
-                x=None,
-                y=None,
-                name=os.path.join(file_path, file_name),
-                type='PNG'
-            )
+            # Titulo (12) e grafico (71) ficam sempre na mesma pagina:
+            if pdf.get_y() + 12 + 71 > pdf.page_break_trigger:
+                pdf.add_page(orientation='P')
+                count = 1
+            pdf.graph_title(instanceGraph['host'], compartment_path[instanceGraph['ocid']])
+            pdf.graph(instanceGraph['metrics'], graphs, legend_y)
 
             # -----------------------------------------------------------------
             # Pula para a proxima pagina depois de colocar 3 graficos na
@@ -708,26 +1266,95 @@ for r, d, f in os.walk(file_path):
                 pdf.add_page(orientation='P')
                 count = 0
 
-            # -----------------------------------------------------------------
-            # Remove o arquivo png depois de utiliza-lo.
-            os.remove(os.path.join(file_path, file_name))
+    # -------------------------------------------------------------------------
+    # Coloca as imagens no PDF
+    # r=root, d=directories, f = files
+    for r, d, f in os.walk(file_path):
+        countdown_files = (len(f)+1)
+        count = 0
+        for file_name in f:
+            countdown_files -= 1
+            if re.match(('^%s.*\.png$' % (tenancy_name)), file_name):
+                count += 1
+                (tenancy, host, ocid) = file_name.split('~')
+                print(' - [%s%03d%s] %s' %
+                      (color['blue'], countdown_files, color['clean'], host))
+
+                pdf.graph_title(host, compartment_path[ocid.split('_')[0]])
+
+                # -------------------------------------------------------------
+                # Coloca o grafico da instance no PDF:
+                pdf.image(
+                    h=71,   # Altura
+                    w=190,  # Largura
+                    x=None,
+                    y=None,
+                    name=os.path.join(file_path, file_name),
+                    type='PNG'
+                )
+
+                # -------------------------------------------------------------
+                # Pula para a proxima pagina depois de colocar 3 graficos na
+                # mesma pagina.
+                if count == 3:
+                    pdf.add_page(orientation='P')
+                    count = 0
+
+                # -------------------------------------------------------------
+                # Remove o arquivo png depois de utiliza-lo.
+                os.remove(os.path.join(file_path, file_name))
+
+    # -------------------------------------------------------------------------
+    # Grava o arquivo PDF em disco:
+    print(f' `-> Gravando arquivo pdf...\n')
+    pdf.output(instance_perfornace_report, "F")
+
+    #
+    # Cria um zip com os arquivos csv e pdf do report
+    print(f'- Criando arquivo zip...')
+    with ZipFile(zip_output_file, 'w', ZIP_DEFLATED) as zipf:
+        zipdir(('%s/%s' % (work_dir, tenancy_name)), zipf)
+    zipf.close()
+
+    # -------------------------------------------------------------------------
+    # Mantem o ultimo relatorio em memoria para o endpoint do modo servico:
+    if service_mode:
+        report = {
+            'generated': today.strftime("%Y-%m-%d %H:%M:%S"),
+            'instances': instanceData,
+            'files': dict()
+        }
+        for (name, path) in (
+            ('instance_list.csv', instance_list_file),
+            ('performance.csv', instance_perfornace_file),
+            ('report.pdf', instance_perfornace_report),
+            ('report.zip', zip_output_file)
+        ):
+            if exists(path):
+                with open(path, 'rb') as f:
+                    report['files'][name] = f.read()
+        report['zip_file'] = zip_output_file
+        with report_lock:
+            previous_zip = latest_report.get('zip_file')
+            latest_report.clear()
+            latest_report.update(report)
+
+        # ---------------------------------------------------------------------
+        # No modo servico apenas o zip da ultima coleta e mantido em disco:
+        if previous_zip and previous_zip != zip_output_file and exists(previous_zip):
+            os.remove(previous_zip)
+
+    print(f'- Limpando workdir...')
+    os.remove(instance_perfornace_report)
+    os.remove(instance_list_file)
+    os.remove(instance_perfornace_file)
+    os.rmdir(file_path)
+
+    print('\nFinished!\n (-̀ᴗ-́)و ̑̑ ')
 
 # -----------------------------------------------------------------------------
-# Grava o arquivo PDF em disco:
-print(f' `-> Gravando arquivo pdf...\n')
-pdf.output(instance_perfornace_report, "F")
-
-#
-# Cria um zip com os arquivos csv e pdf do report
-print(f'- Criando arquivo zip...')
-with ZipFile(zip_output_file, 'w', ZIP_DEFLATED) as zipf:
-    zipdir(('%s/%s' % (work_dir, tenancy_name)), zipf)
-zipf.close()
-
-print(f'- Limpando workdir...')
-os.remove(instance_perfornace_report)
-os.remove(instance_list_file)
-os.remove(instance_perfornace_file)
-os.rmdir(file_path)
-
-print('\nFinished!\n (-̀ᴗ-́)و ̑̑ ')
+# Execucao unica (padrao) ou modo servico:
+if service_mode:
+    start_service()
+else:
+    run_report()